@@ -0,0 +1,44 @@
+import gzip
+import zlib
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+class _SyncFlushGzipFile(gzip.GzipFile):
+    """GzipFile that sync-flushes after every write so each chunk is emitted immediately"""
+
+    def write(self, data) -> int:
+        written = super().write(data)
+        if written:
+            self.flush(zlib.Z_SYNC_FLUSH)
+        return written
+
+class FlushingGZipResponder(GZipResponder):
+    """
+    GZipResponder whose compressor is flushed after each body write.
+    - Starlette's responder never flushes its GzipFile between streamed chunks,
+      so zlib holds a gzipped StreamingResponse back until the stream ends
+    - Z_SYNC_FLUSH pushes every chunk out on a byte boundary, keeping streams incremental
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int, compresslevel: int = 9) -> None:
+        super().__init__(app, minimum_size, compresslevel=compresslevel)
+        self.gzip_file = _SyncFlushGzipFile(
+            mode="wb", fileobj=self.gzip_buffer, compresslevel=compresslevel
+        )
+
+class FlushingGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that compresses streaming responses without buffering them"""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            headers = Headers(scope=scope)
+            if "gzip" in headers.get("Accept-Encoding", ""):
+                responder = FlushingGZipResponder(
+                    self.app, self.minimum_size, compresslevel=self.compresslevel
+                )
+                await responder(scope, receive, send)
+                return
+
+        await self.app(scope, receive, send)
@@ -0,0 +1,40 @@
+import orjson
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+HEALTH_PATH = "/health"
+HEALTH_BODY = orjson.dumps({"status": "ok"})
+
+class HealthCheckInterceptor:
+    """
+    Pure ASGI wrapper that answers GET /health before any middleware or routing runs.
+    - Never touches a thread pool, so probes stay fast even when workers are saturated
+    - Returns a static JSON body (no serialization per probe)
+    - Everything else is passed straight through to the wrapped app
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"] == HEALTH_PATH:
+            if scope["method"] != "GET":
+                await send({
+                    "type": "http.response.start",
+                    "status": 405,
+                    "headers": [(b"allow", b"GET")]
+                })
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(HEALTH_BODY)).encode())
+                ]
+            })
+            await send({"type": "http.response.body", "body": HEALTH_BODY})
+            return
+
+        await self.app(scope, receive, send)
@@ -1,94 +1,159 @@
+import logging
 import os
 import time
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+import httpx
+import orjson
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
+from app.gzip_middleware import FlushingGZipMiddleware
+from app.health_interceptor import HealthCheckInterceptor
 from app.routers import broken, fixed
 
+# Production: hand off to Gunicorn (see gunicorn_conf.py) before this process builds
+# an app that exec would throw away
+if __name__ == "__main__" and os.getenv("ENV", "").lower() == "prod":
+    conf = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn_conf.py")
+    os.execvp("gunicorn", ["gunicorn", "-c", conf, "app.main:app"])
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+# httpx logs every request at INFO; keep the stream path quiet unless it warns
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# The mock LLM is co-located, so talk to it over a UNIX domain socket instead of loopback TCP
+MOCK_LLM_UDS = os.getenv("MOCK_LLM_UDS", "/tmp/mockllm.sock")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create one shared httpx client per process, used by both routers, so upstream
+    connections are pooled and reused across requests instead of re-opened per stream
+    """
+    # Logged here rather than at import: the module may be imported more than once per worker
+    if current_mode == "broken":
+        logger.info("🔥 Running in BROKEN mode. Streams are capped by STREAM_LIMITER! 🔥")
+        logger.info("🔥 STREAM_LIMITER has 4 tokens - 5th concurrent request will hang")
+    else:
+        logger.info("✅ Running in FIXED mode. Using async client. ✅")
+        logger.info("✅ No thread pool limits - scales to thousands of concurrent requests")
+    
+    # Pool limits must live on the transport when one is passed explicitly
+    transport = httpx.AsyncHTTPTransport(
+        uds=MOCK_LLM_UDS,
+        limits=httpx.Limits(max_connections=1024, max_keepalive_connections=256)
+    )
+    async with httpx.AsyncClient(
+        base_url="http://mock",
+        transport=transport,
+        # Routers forward aiter_raw() bytes untouched, so never ask upstream to compress them
+        headers={"Accept-Encoding": "identity"},
+        timeout=httpx.Timeout(300.0, connect=60.0)
+    ) as client:
+        app.state.http_client = client
+        yield
+
 # Create FastAPI app
-app = FastAPI(
+fastapi_app = FastAPI(
     title="FastAPI Thread Exhaustion Reproduction",
     description="Demonstrates thread exhaustion problem with streaming responses and the solution",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+    # No /docs, /redoc or /openapi.json: unused by a streaming proxy
+    docs_url=None,
+    redoc_url=None,
+    openapi_url=None
 )
 
+# Compress responses (including streams) for clients sending Accept-Encoding: gzip.
+# The flushing responder emits each streamed chunk as it arrives instead of at the end.
+fastapi_app.add_middleware(FlushingGZipMiddleware, minimum_size=512, compresslevel=5)
+
 # Get app version from environment variable
 APP_VERSION = os.getenv("APP_VERSION", "fixed").lower()
 
 # Include the appropriate router based on environment
 if APP_VERSION == "broken":
-    print("🔥 Running in BROKEN mode. Expect thread exhaustion! 🔥")
-    print("🔥 Thread pool limited to 4 workers - 5th concurrent request will hang")
-    app.include_router(broken.router)
+    fastapi_app.include_router(broken.router)
     current_mode = "broken"
 else:
-    print("✅ Running in FIXED mode. Using async client. ✅")
-    print("✅ No thread pool limits - scales to thousands of concurrent requests")
-    app.include_router(fixed.router)
+    fastapi_app.include_router(fixed.router)
     current_mode = "fixed"
 
-# Define health check based on mode - crucial for demonstrating the problem
+# /health itself is served by HealthCheckInterceptor (async, static, never queued).
+# Broken mode keeps a probe that competes with streams to reproduce the cascade.
 if APP_VERSION == "broken":
-    # Import the same limited thread pool used by the broken router
-    import asyncio
-    from app.routers.broken import LIMITED_THREAD_POOL
+    import anyio.to_thread
+    # Import the same limiter used by the broken router
+    from app.routers.broken import STREAM_LIMITER
     
-    @app.get("/health")
-    async def health_check_broken():
+    @fastapi_app.get("/health/threaded")
+    async def health_check_threaded():
         """
-        BROKEN: This explicitly uses the same limited thread pool as streaming requests
-        When all 4 threads are exhausted by streaming requests, this cannot execute!
+        BROKEN: This explicitly runs in a thread under the same limiter as streaming requests
+        When all 4 tokens are held by streaming requests, this cannot execute!
         """
-        loop = asyncio.get_running_loop()
-        
         def blocking_health_check():
             # Simulate some blocking operation to ensure it uses a thread
-            time.sleep(0.1)  
+            time.sleep(0.1)
             return {
                 "status": "ok",
                 "timestamp": time.time(),
                 "mode": "broken",
-                "message": "Health check - but thread pool may be exhausted!"
+                "message": "Health check - but thread limiter may be exhausted!"
             }
         
-        # Force this to use the same limited thread pool as streaming requests
-        return await loop.run_in_executor(LIMITED_THREAD_POOL, blocking_health_check)
+        return await anyio.to_thread.run_sync(blocking_health_check, limiter=STREAM_LIMITER)
+
+# Root instructions depend only on the startup mode, so build and serialize them once
+_ROOT_PAYLOAD = {
+    "mode": current_mode,
+    "endpoints": {
+        "/api/v1/chat/stream": "Stream endpoint (demonstrates the problem/solution)",
+        "/api/v1/info": "Information about current implementation",
+        "/health": "Health check endpoint (answered before middleware, never queued)"
+    },
+    "testing": {
+        "broken_mode": "Set APP_VERSION=broken and test with 5+ concurrent requests",
+        "fixed_mode": "Default mode, handles unlimited concurrent requests",
+        "load_test": "Use locust to demonstrate the difference"
+    }
+}
+
+if current_mode == "broken":
+    _ROOT_PAYLOAD["endpoints"]["/health/threaded"] = "Thread-backed health check sharing the stream limiter (canary for exhaustion)"
+    _ROOT_PAYLOAD["warning"] = "🔥 BROKEN MODE: Max 4 concurrent streams, /health/threaded will fail under load"
 else:
-    @app.get("/health")
-    async def health_check_fixed():
-        """
-        FIXED: This is async and doesn't need threads - always responsive
-        """
-        return {
-            "status": "ok",
-            "timestamp": time.time(),
-            "mode": "fixed",
-            "message": "Health check successful - async and always responsive!"
-        }
-
-@app.get("/")
+    _ROOT_PAYLOAD["info"] = "✅ FIXED MODE: Unlimited concurrent streams, /health always responsive"
+
+_ROOT_BYTES = orjson.dumps(_ROOT_PAYLOAD)
+
+@fastapi_app.get("/")
 async def root():
     """Root endpoint with usage instructions"""
-    instructions = {
-        "mode": current_mode,
-        "endpoints": {
-            "/api/v1/chat/stream": "Stream endpoint (demonstrates the problem/solution)",
-            "/api/v1/info": "Information about current implementation",
-            "/health": "Health check endpoint (canary for thread exhaustion)"
-        },
-        "testing": {
-            "broken_mode": "Set APP_VERSION=broken and test with 5+ concurrent requests",
-            "fixed_mode": "Default mode, handles unlimited concurrent requests",
-            "load_test": "Use locust to demonstrate the difference"
-        }
-    }
-    
-    if current_mode == "broken":
-        instructions["warning"] = "🔥 BROKEN MODE: Max 4 concurrent streams, /health will fail under load"
-    else:
-        instructions["info"] = "✅ FIXED MODE: Unlimited concurrent streams, /health always responsive"
-    
-    return instructions
+    return Response(content=_ROOT_BYTES, media_type="application/json")
+
+# ASGI entry point: /health is answered before the FastAPI middleware stack runs
+app = HealthCheckInterceptor(fastapi_app)
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    # One event loop per core; shared client and stream limiter stay per-process.
+    # Broken mode needs a single process so its 4-token limiter is the real, global cap.
+    if APP_VERSION == "broken":
+        workers = 1
+    else:
+        workers = int(os.getenv("WORKERS", os.cpu_count() or 1))
+    # A single worker runs the app object already built here; only multi-worker
+    # needs the import string, so workers can import it themselves
+    uvicorn.run(
+        app if workers == 1 else "app.main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools"
+    )
\ No newline at end of file
@@ -1,74 +1,71 @@
-import asyncio
-import time
-from concurrent.futures import ThreadPoolExecutor
-from typing import Generator
+import logging
+from typing import AsyncGenerator
 
-import requests
-from fastapi import APIRouter
+import httpx
+from anyio import CapacityLimiter
+from fastapi import APIRouter, Request
 from fastapi.responses import StreamingResponse
 
-# Create a deliberately small thread pool to demonstrate the problem
-# In real scenarios, this would be the default FastAPI thread pool getting exhausted
+# Deliberately small concurrency cap to demonstrate the problem
+# Each stream holds one token for its whole duration, so the 5th concurrent request waits.
+# /health/threaded runs its blocking check in a worker thread under the same limiter,
+# so it queues behind streams just like an exhausted thread pool.
 MAX_WORKERS = 4
-LIMITED_THREAD_POOL = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+STREAM_LIMITER = CapacityLimiter(MAX_WORKERS)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/v1", tags=["broken"])
 
-def blocking_stream_from_llm() -> Generator[bytes, None, None]:
+async def stream_from_llm(request: Request) -> AsyncGenerator[bytes, None]:
     """
-    This function simulates the problematic pattern:
-    - Uses blocking requests library
-    - Holds a thread for the entire duration of the stream
-    - Each concurrent request consumes one thread from the limited pool
+    This function simulates the problematic pattern with async I/O:
+    - Holds one of MAX_WORKERS limiter tokens for the entire duration of the stream
+    - Each concurrent request consumes one token, the 5th waits until one frees up
+    - Waits on I/O in the event loop, so no thread is pinned while queued or streaming
+    - Uses the process-wide httpx client from the app lifespan
     """
-    print("🔥 Starting blocking stream request (will hold thread for ~45 seconds)")
-    
+    client: httpx.AsyncClient = request.app.state.http_client
+
+    # Borrow with a per-stream object, not the current task: the generator may be closed from another task
+    borrower = object()
+    await STREAM_LIMITER.acquire_on_behalf_of(borrower)
     try:
-        # This is the core problem: blocking HTTP request that streams data
-        with requests.get(
-            "http://localhost:8001/slow_stream?chunks=30&delay=1.5", 
-            stream=True,
-            timeout=60
-        ) as response:
-            response.raise_for_status()
-            
-            # Iterate through the response chunks - this blocks the thread
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:
-                    # Simulate some processing time
-                    time.sleep(0.01)
+        logger.debug("starting broken stream (holding a token)")
+
+        try:
+            async with client.stream(
+                "GET",
+                "/slow_stream?chunks=30&delay=1.5",
+                timeout=httpx.Timeout(60.0, connect=10.0)
+            ) as response:
+                response.raise_for_status()
+
+                async for chunk in response.aiter_raw():
                     yield chunk
-                    
-    except Exception as e:
-        print(f"🔥 Error in blocking stream: {e}")
-        yield f"Error: {str(e)}".encode()
-    
-    print("🔥 Finished blocking stream request (thread now freed)")
+
+        except Exception as e:
+            logger.error("error in broken stream: %s", e)
+            yield f"Error: {str(e)}".encode()
+
+        logger.debug("finished broken stream")
+    finally:
+        STREAM_LIMITER.release_on_behalf_of(borrower)
 
 @router.get("/chat/stream")
-async def chat_stream_broken():
+async def chat_stream_broken(request: Request):
     """
-    This endpoint demonstrates the thread exhaustion problem.
-    
+    This endpoint demonstrates the exhaustion problem.
+
     The issue:
-    1. Each request runs blocking_stream_from_llm() in a thread from LIMITED_THREAD_POOL
-    2. The thread is held for the entire duration of the stream (~20 seconds)
-    3. With only 4 threads available, the 5th concurrent request will hang
-    4. The /health endpoint will also become unresponsive as threads are exhausted
+    1. Each request holds a token from STREAM_LIMITER for the entire stream (~45 seconds)
+    2. With only 4 tokens available, the 5th concurrent request will hang
+    3. /health/threaded needs a token for its worker thread and becomes unresponsive
     """
-    loop = asyncio.get_running_loop()
-    
-    # This is where the magic happens - we explicitly use our limited thread pool
-    # In a real FastAPI app, this would be the default thread pool getting exhausted
-    stream_generator = await loop.run_in_executor(
-        LIMITED_THREAD_POOL, 
-        blocking_stream_from_llm
-    )
-    
     return StreamingResponse(
-        stream_generator, 
+        stream_from_llm(request),
         media_type="text/plain",
-        headers={"X-Stream-Type": "broken-blocking"}
+        headers={"X-Stream-Type": "broken-limited"}
     )
 
 @router.get("/info")
@@ -76,11 +73,11 @@ async def info():
     """Information about the broken implementation"""
     return {
         "implementation": "broken",
-        "thread_pool_size": MAX_WORKERS,
-        "problem": "Uses blocking requests library with limited thread pool",
+        "stream_limiter_tokens": MAX_WORKERS,
+        "problem": "Caps streams and threaded work with a small CapacityLimiter held for the whole stream",
         "symptoms": [
-            "Thread exhaustion under concurrent load",
-            "/health endpoint becomes unresponsive",
-            "Requests hang when thread pool is full"
+            "Limiter exhaustion under concurrent load",
+            "/health/threaded becomes unresponsive",
+            "Requests hang when all tokens are held"
         ]
-    }
\ No newline at end of file
+    }
@@ -1,45 +1,50 @@
+import asyncio
+import logging
 from typing import AsyncGenerator
 
 import httpx
 from fastapi import APIRouter, Request
 from fastapi.responses import StreamingResponse
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/v1", tags=["fixed"])
 
 async def async_stream_from_llm(request: Request) -> AsyncGenerator[bytes, None]:
     """
     This function demonstrates the correct async pattern:
-    - Uses async httpx client instead of blocking requests
+    - Uses the shared async httpx client instead of blocking requests
+    - Reuses pooled upstream connections instead of opening one per request
     - Uses async for to iterate over response chunks
     - Yields control to the event loop while waiting for data
-    - Properly handles client disconnections
+    - Handles client disconnects without polling: Starlette cancels the generator,
+      and the async with blocks close the upstream stream
     """
-    print("✅ Starting async stream request (non-blocking)")
+    logger.debug("starting async stream")
+    
+    # ✅ Shared client created in the app lifespan (timeouts and pool limits live there)
+    client: httpx.AsyncClient = request.app.state.http_client
     
     try:
-        # ✅ Set reasonable timeout to prevent hung connections
-        timeout_config = httpx.Timeout(300.0, connect=60.0)
-        async with httpx.AsyncClient(timeout=timeout_config) as client:
-            async with client.stream(
-                "GET", 
-                "http://localhost:8001/slow_stream?chunks=20&delay=1.0"
-            ) as response:
-                response.raise_for_status()
-                
-                # The key difference: async for yields control to event loop
-                async for chunk in response.aiter_bytes(chunk_size=1024):
-                    # Check for client disconnect to prevent zombie streams
-                    if await request.is_disconnected():
-                        print("✅ Client disconnected, closing stream")
-                        break
-                    
-                    yield chunk
+        async with client.stream(
+            "GET", 
+            "/slow_stream?chunks=20&delay=1.0"
+        ) as response:
+            response.raise_for_status()
+            
+            # The key difference: async for yields control to event loop
+            async for chunk in response.aiter_raw():
+                yield chunk
                     
+    except asyncio.CancelledError:
+        # Client disconnected: the upstream stream is already closed by the context managers
+        logger.debug("client disconnected, closing stream")
+        raise
     except Exception as e:
-        print(f"✅ Error in async stream: {e}")
+        logger.error("error in async stream: %s", e)
         yield f"Error: {str(e)}".encode()
     
-    print("✅ Finished async stream request (no threads consumed)")
+    logger.debug("finished async stream")
 
 @router.get("/chat/stream")
 async def chat_stream_fixed(request: Request):
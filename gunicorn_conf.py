@@ -0,0 +1,20 @@
+import os
+
+# Gunicorn settings for multi-worker deployments: gunicorn -c gunicorn_conf.py app.main:app
+bind = f"0.0.0.0:{os.getenv('PORT', 8000)}"
+# Broken mode's stream limiter is per process, so it only caps globally with one worker
+if os.getenv("APP_VERSION", "fixed").lower() == "broken":
+    workers = 1
+else:
+    workers = int(os.getenv("WORKERS", max(2, os.cpu_count() or 1)))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app once in the master and fork (copy-on-write); the shared httpx client
+# is still created per worker in the lifespan handler, after the fork
+preload_app = True
+
+# Keep worker heartbeat files in tmpfs so slow disks can't stall workers into timeouts
+# (falls back to Gunicorn's default where /dev/shm doesn't exist, e.g. macOS)
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+keepalive = 5
@@ -1,29 +1,45 @@
 import asyncio
-from fastapi import FastAPI
+import functools
+from fastapi import FastAPI, Query
 from fastapi.responses import StreamingResponse
 
-app = FastAPI(title="Mock LiteLLM Service")
+# Upper bound on ?chunks=: payloads are built eagerly and cached per count
+MAX_CHUNKS = 1000
+
+app = FastAPI(
+    title="Mock LiteLLM Service",
+    docs_url=None,
+    redoc_url=None,
+    openapi_url=None
+)
+
+@functools.lru_cache(maxsize=128)
+def _payloads(chunks: int) -> list[bytes]:
+    """Encoded SSE lines for a given chunk count, built once and reused"""
+    return [
+        f"data: This is chunk {i+1} of {chunks} from the mock LLM service. "
+        f"This simulates realistic streaming response patterns from LiteLLM.\n\n".encode("utf-8")
+        for i in range(chunks)
+    ]
 
 async def slow_text_stream(chunks: int = 10, delay: float = 0.5):
     """
     An async generator that yields data chunks slowly.
     This simulates a slow LLM response.
     """
-    for i in range(chunks):
-        chunk_data = f"data: This is chunk {i+1} of {chunks} from the mock LLM service. " \
-                    f"This simulates realistic streaming response patterns from LiteLLM.\n\n"
-        yield chunk_data.encode("utf-8")
+    for payload in _payloads(chunks):
+        yield payload
         await asyncio.sleep(delay)
 
 @app.get("/slow_stream")
-async def get_slow_stream(chunks: int = 20, delay: float = 1.0):
+async def get_slow_stream(chunks: int = Query(20, ge=1, le=MAX_CHUNKS), delay: float = 1.0):
     """
     Endpoint that returns a slow streaming response.
     It's async, so it can handle many concurrent requests efficiently.
     The slowness is deliberate to simulate the LLM.
     
     Query parameters:
-    - chunks: Number of chunks to send (default: 20)
+    - chunks: Number of chunks to send (default: 20, 1..MAX_CHUNKS)
     - delay: Delay between chunks in seconds (default: 1.0)
     """
     return StreamingResponse(
@@ -37,5 +53,12 @@ async def health_check():
     return {"status": "ok", "service": "mock-litellm"}
 
 if __name__ == "__main__":
+    import os
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    uvicorn.run(
+        "main:app",
+        uds=os.getenv("MOCK_LLM_UDS", "/tmp/mockllm.sock"),
+        workers=int(os.getenv("WORKERS", os.cpu_count() or 1)),
+        loop="uvloop",
+        http="httptools"
+    )
\ No newline at end of file